@@ -1,11 +1,21 @@
 import os
 import asyncio
+import hashlib
+import hmac
+import json
 import logging
+from pathlib import Path
 
+import orjson
 from aiohttp import web
-from telegram import FSInputFile, InlineKeyboardButton, InlineKeyboardMarkup, Update
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.constants import ParseMode
-from telegram.ext import ApplicationBuilder, CommandHandler, ContextTypes
+from telegram.ext import Application, ApplicationBuilder, CommandHandler, ContextTypes
+
+try:
+    import uvloop
+except ImportError:  # uvloop не поддерживает Windows
+    uvloop = None
 
 # ---------- Логи ----------
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
@@ -14,6 +24,50 @@ log = logging.getLogger("bugman")
 # ---------- Конфиг ----------
 # В Render добавь переменную окружения TOKEN (обяз.)
 TOKEN = os.environ["TOKEN"]
+# Публичный адрес сервиса. Если он известен — получаем апдейты через webhook,
+# иначе (например, локально) — через polling. Render сам выставляет RENDER_EXTERNAL_URL.
+PUBLIC_URL = os.environ.get("PUBLIC_URL") or os.environ.get("RENDER_EXTERNAL_URL")
+WEBHOOK_PATH = f"/tg/{TOKEN}"
+# Telegram присылает его в X-Telegram-Bot-Api-Secret-Token; по умолчанию выводим из токена
+WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET") or hashlib.sha256(TOKEN.encode()).hexdigest()
+GAME_URL = "https://t.me/bugman_bot/myapp"
+START_GIF = "bugman.gif"
+FILE_ID_CACHE_PATH = "file_ids.json"
+
+# ---------- Приветствие (собирается один раз, а не на каждый /start) ----------
+# Текст сообщения в формате Markdown
+START_TEXT = (
+    "🤖 Привет! Это *Bugman*.\n"
+    "Ты — жёлтый, они — злые, монетки — вкусные.\n\n"
+    "Выживи как можно дольше и стань легендой!\n"
+    "Осторожно: игра вызывает привыкание 😎\n\n"
+    "🎯 Жми «Играть» и докажи, что ты главный в этом лабиринте."
+)
+
+# Инлайн-кнопка с ссылкой на игру
+START_MARKUP = InlineKeyboardMarkup([[InlineKeyboardButton("🎮 Играть", url=GAME_URL)]])
+
+# ---------- Кэш file_id ----------
+# После первой загрузки Telegram отдаёт file_id — дальше шлём его, а не сам файл
+FILE_ID_CACHE: dict[str, str] = {}
+
+
+def load_file_ids() -> None:
+    try:
+        with open(FILE_ID_CACHE_PATH, encoding="utf-8") as f:
+            FILE_ID_CACHE.update(json.load(f))
+    except FileNotFoundError:
+        pass
+    except Exception:
+        log.exception("Failed to load file_id cache")
+
+
+def save_file_ids() -> None:
+    try:
+        with open(FILE_ID_CACHE_PATH, "w", encoding="utf-8") as f:
+            json.dump(FILE_ID_CACHE, f)
+    except Exception:
+        log.exception("Failed to save file_id cache")
 
 # ---------- Telegram-handlers ----------
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -26,69 +80,117 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.effective_chat.id
 
     # Сначала отправляем GIF. Если не получится, просто логируем ошибку.
+    file_id = FILE_ID_CACHE.get(START_GIF)
     try:
-        await context.bot.send_animation(
-            chat_id=chat_id, animation=FSInputFile("bugman.gif")
+        msg = await context.bot.send_animation(
+            chat_id=chat_id, animation=file_id or Path(START_GIF)
         )
+        if not file_id and msg.animation:
+            FILE_ID_CACHE[START_GIF] = msg.animation.file_id
+            save_file_ids()
     except Exception:
         log.exception("Failed to send start GIF")
-
-    # Текст сообщения в формате Markdown
-    text = (
-        "🤖 Привет! Это *Bugman*.\n"
-        "Ты — жёлтый, они — злые, монетки — вкусные.\n\n"
-        "Выживи как можно дольше и стань легендой!\n"
-        "Осторожно: игра вызывает привыкание 😎\n\n"
-        "🎯 Жми «Играть» и докажи, что ты главный в этом лабиринте."
-    )
-
-    # Инлайн-кнопка с ссылкой на игру
-    kb = [[InlineKeyboardButton("🎮 Играть", url="https://t.me/bugman_bot/myapp")]]
-    markup = InlineKeyboardMarkup(kb)
+        # Протухший file_id (например, сменился бот) — в следующий раз загрузим файл заново
+        FILE_ID_CACHE.pop(START_GIF, None)
 
     await context.bot.send_message(
         chat_id=chat_id,
-        text=text,
+        text=START_TEXT,
         parse_mode=ParseMode.MARKDOWN,
-        reply_markup=markup,
+        reply_markup=START_MARKUP,
     )
 
-# ---------- Aiohttp health ----------
+# ---------- Aiohttp health + webhook ----------
+APPLICATION = web.AppKey("application", Application)
+
+
 async def health(_: web.Request) -> web.Response:
     return web.Response(text="Bugman bot is running ✅")
 
+
+async def telegram_webhook(request: web.Request) -> web.Response:
+    secret = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+    if not hmac.compare_digest(secret, WEBHOOK_SECRET):
+        return web.Response(status=403)
+    try:
+        data = orjson.loads(await request.read())
+    except orjson.JSONDecodeError:
+        return web.Response(status=400)
+
+    # Только кладём апдейт в очередь: обработка идёт в фоне, Telegram сразу получает 200
+    application = request.app[APPLICATION]
+    application.update_queue.put_nowait(Update.de_json(data, application.bot))
+    return web.Response()
+
 # ---------- Асинхронный main: бот + веб-сервер в одном event loop ----------
 async def main():
+    load_file_ids()
+
     # --- Telegram Application ---
-    application = ApplicationBuilder().token(TOKEN).build()
+    # Апдейты обрабатываются параллельно: при всплеске /start пользователи не ждут
+    # друг друга (по умолчанию PTB обрабатывает их по одному). Исходящий пул
+    # остаётся стандартным (256 соединений); длиннее только таймауты ожидания пула,
+    # подключения и чтения. У getUpdates свой пул: 2 соединения вместо 1.
+    # Исходящие запросы идут по HTTP/2: много запросов в одном TLS-соединении.
+    # getUpdates остаётся на HTTP/1.1 — h2 плохо переносит отмену long-poll запросов.
+    application = (
+        ApplicationBuilder()
+        .token(TOKEN)
+        .concurrent_updates(True)
+        .http_version("2")
+        .pool_timeout(10)
+        .connect_timeout(10)
+        .read_timeout(20)
+        .get_updates_connection_pool_size(2)
+        .get_updates_pool_timeout(10)
+        .build()
+    )
     application.add_handler(CommandHandler("start", start))
 
-    # Инициализируем и запускаем бота (polling) без run_polling, чтобы управлять циклом сами
+    # Инициализируем и запускаем бота без run_polling/run_webhook, чтобы управлять циклом сами
     await application.initialize()
     await application.start()
-    await application.updater.start_polling()
-    log.info("Telegram bot polling started")
 
-    # --- Aiohttp server (для Render) ---
+    # --- Aiohttp server (для Render): health и, если есть PUBLIC_URL, webhook ---
     port = int(os.environ.get("PORT", 10000))
     app = web.Application()
+    app[APPLICATION] = application
     app.router.add_get("/", health)
-    runner = web.AppRunner(app)
+    if PUBLIC_URL:
+        app.router.add_post(WEBHOOK_PATH, telegram_webhook)
+    # access_log=None: путь webhook содержит токен, ему нечего делать в логах
+    runner = web.AppRunner(app, access_log=None)
     await runner.setup()
     site = web.TCPSite(runner, host="0.0.0.0", port=port)
     await site.start()
     log.info(f"Health endpoint started on 0.0.0.0:{port}")
 
+    # Webhook ставим после старта сервера, чтобы первый апдейт было кому принять
+    if PUBLIC_URL:
+        await application.bot.set_webhook(
+            url=PUBLIC_URL.rstrip("/") + WEBHOOK_PATH, secret_token=WEBHOOK_SECRET
+        )
+        log.info("Telegram webhook set")
+    else:
+        await application.updater.start_polling()
+        log.info("Telegram bot polling started")
+
     # Держим процесс живым
     try:
         await asyncio.Event().wait()
     finally:
         # Корректная остановка
-        await application.updater.stop()
+        if application.updater.running:
+            await application.updater.stop()
         await application.stop()
         await application.shutdown()
         await runner.cleanup()
+        save_file_ids()
 
 if __name__ == "__main__":
-    # Один event loop, без потоков — надёжно для Python 3.13/asyncio
-    asyncio.run(main())
+    # Один event loop, без потоков — надёжно для Python 3.13/asyncio.
+    # uvloop.run() вместо uvloop.install(): install() устарел начиная с 3.12
+    if uvloop is not None:
+        uvloop.run(main())
+    else:
+        asyncio.run(main())
@@ -2,21 +2,27 @@
 
 from __future__ import annotations
 
+import asyncio
 import hashlib
 import hmac
-import json
+import itertools
 import os
-from datetime import datetime
+import queue
+import re
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
 from os import getenv
-from urllib.parse import parse_qsl
+from urllib.parse import unquote_plus
 
 import aiosqlite
+import orjson
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, Response
-from pydantic import BaseModel
+from fastapi.responses import ORJSONResponse, Response
 from dotenv import load_dotenv
 import logging
+from logging.handlers import QueueHandler, QueueListener
 from typing import Tuple, Optional
 
 
@@ -29,7 +35,20 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("bugman")
 
 DATABASE = "leaderboard.db"
+READ_POOL_SIZE = 8
+CHECKPOINT_INTERVAL = 60
 RATE_LIMIT_SECONDS = 4
+RATE_LIMIT_EVICT_INTERVAL = 60
+RATE_LIMIT_CAPACITY = 100_000
+AUTH_FAIL_WINDOW = 60
+AUTH_FAIL_LIMIT = 20
+AUTH_FAIL_CAPACITY = 100_000
+MAX_INIT_DATA_LEN = 4096
+LEADERBOARD_TTL = 2.0
+LEADERBOARD_CACHE_SIZE = 256
+SCORE_BATCH_SIZE = 128
+# Largest value a SQLite INTEGER column can hold.
+MAX_SCORE = 2**63 - 1
 
 CREATE_TABLE_SQL = """
 CREATE TABLE IF NOT EXISTS players (
@@ -37,12 +56,236 @@ CREATE TABLE IF NOT EXISTS players (
   username TEXT,
   display_name TEXT,
   best_score INTEGER DEFAULT 0,
-  updated_at TEXT
+  updated_at_ms INTEGER
 );
+CREATE INDEX IF NOT EXISTS idx_players_best ON players(best_score DESC, id);
 """
 
+# Databases created before updated_at_ms stored the time of the best score as
+# an ISO string in updated_at; carry it over as Unix milliseconds.
+MIGRATE_UPDATED_AT_SQL = """
+BEGIN;
+ALTER TABLE players ADD COLUMN updated_at_ms INTEGER;
+UPDATE players
+SET updated_at_ms = CAST(strftime('%s', updated_at) AS INTEGER) * 1000
+WHERE updated_at IS NOT NULL;
+COMMIT;
+"""
+
+# WAL lets the reader connections run alongside the single writer; with WAL,
+# synchronous=NORMAL only fsyncs on checkpoint instead of on every commit.
+SQLITE_PRAGMAS = """
+PRAGMA journal_mode=WAL;
+PRAGMA synchronous=NORMAL;
+PRAGMA temp_store=MEMORY;
+PRAGMA cache_size=-64000;
+PRAGMA mmap_size=268435456;
+PRAGMA busy_timeout=5000;
+"""
+
+# One statement upserts a whole batch of players, keeps the higher score and
+# returns the resulting best per id; {values} is one "(?, ?, ?, ?, ?)" per row.
+UPSERT_SCORES_SQL = """
+INSERT INTO players (id, username, display_name, best_score, updated_at_ms)
+VALUES {values}
+ON CONFLICT(id) DO UPDATE SET
+  username=excluded.username,
+  display_name=excluded.display_name,
+  best_score=MAX(players.best_score, excluded.best_score),
+  updated_at_ms=CASE WHEN excluded.best_score > players.best_score
+    THEN excluded.updated_at_ms ELSE players.updated_at_ms END
+RETURNING id, best_score
+"""
+
+# user id -> time.monotonic() of the last accepted score, oldest first
+LAST_SCORES: OrderedDict[str, float] = OrderedDict()
+
+# client ip -> (time.monotonic() the window started, failed auth attempts in it),
+# oldest window first
+AUTH_FAILURES: OrderedDict[str, tuple[float, int]] = OrderedDict()
+
+# Scores waiting for the writer: user id -> (score, username,
+# display_name, updated_at_ms), plus the requests waiting for that user's result.
+PENDING_SCORES: dict[str, tuple[int, Optional[str], str, int]] = {}
+SCORE_WAITERS: dict[str, list[asyncio.Future]] = {}
+
+
+async def open_db(read_only: bool = False) -> aiosqlite.Connection:
+    if read_only:
+        db = await aiosqlite.connect(f"file:{DATABASE}?mode=ro", uri=True)
+    else:
+        db = await aiosqlite.connect(DATABASE)
+    await db.executescript(SQLITE_PRAGMAS)
+    return db
+
+
+async def _checkpoint_loop(db: aiosqlite.Connection) -> None:
+    """Truncate the WAL periodically so requests never pay for a checkpoint."""
+    while True:
+        await asyncio.sleep(CHECKPOINT_INTERVAL)
+        try:
+            await db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        except Exception:
+            logger.exception("wal checkpoint failed")
+
+
+async def _evict_rate_limits() -> None:
+    """Drop rate-limit entries whose window has passed to keep LAST_SCORES bounded."""
+    while True:
+        await asyncio.sleep(RATE_LIMIT_EVICT_INTERVAL)
+        cutoff = time.monotonic() - RATE_LIMIT_SECONDS
+        # Entries are kept in timestamp order, so expired ones are all at the front.
+        while LAST_SCORES and next(iter(LAST_SCORES.values())) < cutoff:
+            LAST_SCORES.popitem(last=False)
+        cutoff = time.monotonic() - AUTH_FAIL_WINDOW
+        while AUTH_FAILURES and next(iter(AUTH_FAILURES.values()))[0] < cutoff:
+            AUTH_FAILURES.popitem(last=False)
+
+
+def queue_score(
+    user_id: str, username: Optional[str], display_name: str, score: int
+) -> asyncio.Future:
+    """Queue a score for the writer; the future resolves to the stored best."""
+    prev = PENDING_SCORES.get(user_id)
+    if prev is not None and prev[0] >= score:
+        PENDING_SCORES[user_id] = (prev[0], username, display_name, prev[3])
+    else:
+        PENDING_SCORES[user_id] = (
+            score, username, display_name, int(time.time() * 1000)
+        )
+    fut = asyncio.get_running_loop().create_future()
+    SCORE_WAITERS.setdefault(user_id, []).append(fut)
+    app.state.score_queued.set()
+    return fut
+
+
+async def upsert_scores(db: aiosqlite.Connection, rows: list[tuple]) -> dict[str, int]:
+    """Upsert rows in one transaction and return the stored best per user id."""
+    sql = UPSERT_SCORES_SQL.format(values=", ".join(["(?, ?, ?, ?, ?)"] * len(rows)))
+    params = [value for row in rows for value in row]
+    try:
+        async with db.execute(sql, params) as cur:
+            results = dict(await cur.fetchall())
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        raise
+    return results
+
+
+async def flush_scores(db: aiosqlite.Connection) -> None:
+    """Write up to SCORE_BATCH_SIZE queued scores in one transaction.
+
+    Waiting requests are resolved only after the commit, so a client that
+    reads the leaderboard right after its response already sees its score.
+    If the batch fails, its rows are retried one at a time so that only the
+    requests behind a bad row get the error.
+    """
+    batch = list(itertools.islice(PENDING_SCORES, SCORE_BATCH_SIZE))
+    if not batch:
+        return
+    pending = {user_id: PENDING_SCORES.pop(user_id) for user_id in batch}
+    waiters = {user_id: SCORE_WAITERS.pop(user_id, []) for user_id in batch}
+
+    rows = [
+        (user_id, username, display_name, score, updated_at_ms)
+        for user_id, (score, username, display_name, updated_at_ms) in pending.items()
+    ]
+    errors: dict[str, Exception] = {}
+    try:
+        results = await upsert_scores(db, rows)
+    except Exception:
+        results = {}
+        for row in rows:
+            try:
+                results.update(await upsert_scores(db, [row]))
+            except Exception as exc:
+                logger.exception("score write failed user=%s", row[0])
+                errors[row[0]] = exc
+
+    if any(results.get(k) == v[0] for k, v in pending.items()):
+        app.state.lb_version += 1
+        app.state.lb_cache.clear()
+    for user_id, futures in waiters.items():
+        for fut in futures:
+            if fut.done():
+                continue
+            if user_id in errors:
+                fut.set_exception(errors[user_id])
+            else:
+                fut.set_result(results[user_id])
+
+
+async def drain_scores(db: aiosqlite.Connection) -> None:
+    while PENDING_SCORES:
+        try:
+            await flush_scores(db)
+        except Exception:
+            logger.exception("score flush failed")
+
+
+async def _score_writer_loop(db: aiosqlite.Connection) -> None:
+    """Group commit: scores queued while a batch is being written go into the next one."""
+    while True:
+        await app.state.score_queued.wait()
+        app.state.score_queued.clear()
+        await drain_scores(db)
+
+
+class _RecordQueueHandler(QueueHandler):
+    """QueueHandler that leaves formatting to the listener thread as well."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # post_score logs a line per request: the root handlers' formatting and
+    # stream writes run on a listener thread instead of the event loop.
+    log_queue = queue.SimpleQueue()
+    log_handler = _RecordQueueHandler(log_queue)
+    log_listener = QueueListener(
+        log_queue, *logging.getLogger().handlers, respect_handler_level=True
+    )
+    log_listener.start()
+    logger.addHandler(log_handler)
+    logger.propagate = False
+    app.state.write_db = await open_db()
+    await app.state.write_db.executescript(CREATE_TABLE_SQL)
+    async with app.state.write_db.execute("PRAGMA table_info(players)") as cur:
+        columns = {row[1] for row in await cur.fetchall()}
+    if "updated_at_ms" not in columns:
+        await app.state.write_db.executescript(MIGRATE_UPDATED_AT_SQL)
+    # Refresh planner statistics so the leaderboard query picks idx_players_best.
+    await app.state.write_db.executescript("ANALYZE;")
+    app.state.read_pool = asyncio.Queue()
+    for _ in range(READ_POOL_SIZE):
+        app.state.read_pool.put_nowait(await open_db(read_only=True))
+    app.state.lb_cache = {}
+    app.state.lb_version = 0
+    app.state.score_queued = asyncio.Event()
+    tasks = [
+        asyncio.create_task(_checkpoint_loop(app.state.write_db)),
+        asyncio.create_task(_evict_rate_limits()),
+        asyncio.create_task(_score_writer_loop(app.state.write_db)),
+    ]
+    try:
+        yield
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await drain_scores(app.state.write_db)
+        await app.state.write_db.close()
+        while not app.state.read_pool.empty():
+            await app.state.read_pool.get_nowait().close()
+        logger.removeHandler(log_handler)
+        logger.propagate = True
+        log_listener.stop()
+
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -58,75 +301,184 @@ async def options_score() -> Response:
     return Response(status_code=204)
 
 
-class ScoreIn(BaseModel):
-    initData: str
-    score: int
-
-
-
-def get_tokens() -> list[str]:
+def get_tokens() -> tuple[str, ...]:
     env_tokens = os.getenv("BOT_TOKENS")
     if env_tokens:
-        return [t.strip() for t in env_tokens.split(",") if t.strip()]
+        return tuple(t.strip() for t in env_tokens.split(",") if t.strip())
     t = os.getenv("BOT_TOKEN")
-    return [t] if t else []
+    return (t,) if t else ()
+
+
+def secret_key(token: str) -> bytes:
+    return hmac.new(b"WebAppData", token.encode(), hashlib.sha256).digest()
+
+
+def token_hmacs(tokens: tuple[str, ...]) -> tuple[hmac.HMAC, ...]:
+    """HMAC(secret_key(token)) prototypes with no data fed in yet, one per token.
+
+    The key schedule (both padded key blocks) is hashed once here; verifying
+    a request then only copies a prototype instead of rebuilding it.
+    """
+    return tuple(
+        hmac.new(secret_key(token), digestmod=hashlib.sha256) for token in tokens
+    )
+
+
+# Tokens only change with a redeploy, which restarts the process, so the
+# environment is read and the HMAC prototypes are built once at import.
+TOKENS = get_tokens()
+TOKEN_HMACS = token_hmacs(TOKENS)
 
 
-def check_telegram_auth(init_data: str, tokens: list[str]) -> Tuple[bool, Optional[dict], str, str]:
+def verify_any(
+    data_check_bytes: bytes, recv_hash: bytes, hmacs: tuple[hmac.HMAC, ...]
+) -> bool:
+    """Check the raw 32-byte recv_hash against the HMAC of every configured token.
+
+    All digests are computed and compared before answering, so the timing
+    does not depend on which token (if any) matched. hashlib is OpenSSL's
+    SHA-256 and picks SHA-NI by itself on CPUs that have it.
+    """
+    digests = []
+    for proto in hmacs:
+        m = proto.copy()
+        m.update(data_check_bytes)
+        digests.append(m.digest())
+    return any([hmac.compare_digest(d, recv_hash) for d in digests])
+
+
+HASH_RE = re.compile(r"[0-9a-f]{64}")
+
+
+def _prefix(seg: str) -> str:
+    """Sort key for a "k=v" segment: the key, sliced out without a split list.
+
+    check_telegram_auth gives every segment an "=" before sorting.
+    """
+    return seg[: seg.index("=")]
+
+
+def check_telegram_auth(
+    init_data: str, hmacs: tuple[hmac.HMAC, ...]
+) -> Tuple[bool, Optional[dict], str, str]:
+    # Cheap rejects before parsing: "hash=" plus 64 hex chars is the bare minimum.
+    if not init_data or "hash=" not in init_data:
+        return False, None, "no_hash", ""
+    if len(init_data) < 69:
+        return False, None, "bad_hash", ""
+    if len(init_data) > MAX_INIT_DATA_LEN:
+        return False, None, "too_long", ""
     try:
-        pairs = dict(parse_qsl(init_data, keep_blank_values=True, strict_parsing=False))
-        recv_hash = pairs.pop("hash", None)
+        # One linear scan over the raw "k=v" segments: pick out hash and user and
+        # keep the rest for signing. Telegram signs the decoded values (as
+        # parse_qsl yields them), but only segments with escapes need decoding.
+        recv_hash = None
+        user_json = None
+        segments = []
+        for seg in init_data.split("&"):
+            if not seg:
+                continue
+            if seg.startswith("hash="):
+                recv_hash = seg[5:]
+                continue
+            if "%" in seg or "+" in seg:
+                k, _, v = seg.partition("=")
+                seg = f"{unquote_plus(k)}={unquote_plus(v)}"
+            elif "=" not in seg:
+                seg += "="
+            if seg.startswith("user="):
+                user_json = seg[5:]
+            segments.append(seg)
         if not recv_hash:
             return False, None, "no_hash", ""
-        data_check_string = "\n".join(
-            f"{k}={pairs[k]}" for k in sorted(pairs.keys())
-        )
-        for t in tokens:
-            secret_key = hmac.new(b"WebAppData", t.encode(), hashlib.sha256).digest()
-            calc = hmac.new(secret_key, data_check_string.encode(), hashlib.sha256).hexdigest()
-            if hmac.compare_digest(calc, recv_hash):
-                user_json = pairs.get("user")
-                if not user_json:
-                    return False, None, "no_user", data_check_string
-                try:
-                    user = json.loads(user_json)
-                except Exception:
-                    return False, None, "no_user", data_check_string
-                if "id" not in user:
-                    return False, None, "no_user", data_check_string
-                return True, user, "ok", data_check_string
-        return False, None, "hash_mismatch", data_check_string
+        if not HASH_RE.fullmatch(recv_hash):
+            return False, None, "bad_hash", ""
+        segments.sort(key=_prefix)
+        data_check_string = "\n".join(segments)
+        data_check_bytes = data_check_string.encode()
+        # HASH_RE already guarantees valid hex, so fromhex cannot fail here.
+        recv = bytes.fromhex(recv_hash)
+        if not verify_any(data_check_bytes, recv, hmacs):
+            return False, None, "hash_mismatch", data_check_string
+        if not user_json:
+            return False, None, "no_user", data_check_string
+        try:
+            user = orjson.loads(user_json)
+        except orjson.JSONDecodeError:
+            return False, None, "no_user", data_check_string
+        if "id" not in user:
+            return False, None, "no_user", data_check_string
+        return True, user, "ok", data_check_string
     except Exception:
         return False, None, "exception", ""
 
 
-@app.on_event("startup")
-async def startup() -> None:
-    app.state.db = await aiosqlite.connect(DATABASE)
-    await app.state.db.execute(CREATE_TABLE_SQL)
-    await app.state.db.commit()
+def make_display_name(user: dict, user_id: str) -> str:
+    """Name shown on the leaderboard, at most 24 characters."""
+    display_name = (
+        user.get("username") or user.get("first_name") or user.get("last_name")
+    )
+    if not display_name:
+        return "Player " + user_id[-4:]
+    if len(display_name) > 24:
+        return display_name[:23] + "…"
+    return display_name
 
 
-@app.on_event("shutdown")
-async def shutdown() -> None:
-    await app.state.db.close()
+@asynccontextmanager
+async def reader():
+    """Borrow a read-only connection from the pool."""
+    db = await app.state.read_pool.get()
+    try:
+        yield db
+    finally:
+        app.state.read_pool.put_nowait(db)
 
 
-LAST_SCORES: dict[str, datetime] = {}
+def client_ip(request: Request) -> str:
+    """Address of the client as seen by Render's proxy.
+
+    The proxy appends the address it accepted the connection from to
+    X-Forwarded-For; everything left of that entry comes from the client and
+    can be forged, so only the rightmost entry is used.
+    """
+    forwarded = request.headers.get("x-forwarded-for")
+    if forwarded:
+        return forwarded.rpartition(",")[2].strip()
+    return request.client.host if request.client else "-"
 
 
 @app.post("/score")
-async def post_score(payload: ScoreIn, request: Request):
-    ip = request.client.host if request.client else "-"
+async def post_score(request: Request):
+    ip = client_ip(request)
     user_id = "-"
     reason = "ok"
     status = 200
-    init_len = len(payload.initData) if payload.initData else 0
+    init_len = 0
     try:
-        if payload.initData is None or payload.score is None:
+        # The body is two fields, so it is checked by hand instead of through a
+        # pydantic model: {"initData": str, "score": int in 0..MAX_SCORE}.
+        try:
+            data = orjson.loads(await request.body())
+        except orjson.JSONDecodeError:
+            data = None
+        if not isinstance(data, dict):
+            data = {}
+        init_data = data.get("initData")
+        score = data.get("score")
+        if init_data is None or score is None:
             status = 400
             reason = "missing initData or score"
-            return JSONResponse(
+        elif (
+            not isinstance(init_data, str)
+            or not isinstance(score, int)
+            or isinstance(score, bool)
+            or not 0 <= score <= MAX_SCORE
+        ):
+            status = 400
+            reason = "invalid initData or score"
+        if status == 400:
+            return ORJSONResponse(
                 status_code=400,
                 content={
                     "ok": False,
@@ -134,33 +486,44 @@ async def post_score(payload: ScoreIn, request: Request):
                     "reason": reason,
                 },
             )
+        init_len = len(init_data)
+
+        # Clients that keep sending bad initData are turned away before any HMAC work.
+        now = time.monotonic()
+        failures = AUTH_FAILURES.get(ip)
+        if failures and now - failures[0] < AUTH_FAIL_WINDOW and failures[1] >= AUTH_FAIL_LIMIT:
+            status = 429
+            reason = "rate_limited"
+            return ORJSONResponse(
+                {"ok": False, "error": "too_many_requests", "reason": reason},
+                status_code=429,
+                headers={"Retry-After": str(int(AUTH_FAIL_WINDOW - (now - failures[0])) + 1)},
+            )
 
-        tokens = get_tokens()
-        ok, user, reason_resp, _ = check_telegram_auth(payload.initData, tokens)
+        ok, user, reason_resp, _ = check_telegram_auth(init_data, TOKEN_HMACS)
         if not ok:
             status = 401
             reason = reason_resp
-            return JSONResponse(
+            if failures and now - failures[0] < AUTH_FAIL_WINDOW:
+                AUTH_FAILURES[ip] = (failures[0], failures[1] + 1)
+            else:
+                AUTH_FAILURES[ip] = (now, 1)
+                AUTH_FAILURES.move_to_end(ip)
+                if len(AUTH_FAILURES) > AUTH_FAIL_CAPACITY:
+                    AUTH_FAILURES.popitem(last=False)
+            return ORJSONResponse(
                 {"ok": False, "error": "invalid_init_data", "reason": reason_resp},
                 status_code=401,
             )
 
         user_id = str(user.get("id"))
         username = user.get("username")
-        first_name = user.get("first_name")
-        last_name = user.get("last_name")
-        display_name = (
-            username or first_name or last_name or f"Player {user_id[-4:]}"
-        )
-        if len(display_name) > 24:
-            display_name = display_name[:23] + "…"
+        display_name = make_display_name(user, user_id)
 
-        db = app.state.db
-        now_dt = datetime.utcnow()
         last = LAST_SCORES.get(user_id)
-        if last and (now_dt - last).total_seconds() < RATE_LIMIT_SECONDS:
+        if last is not None and now - last < RATE_LIMIT_SECONDS:
             reason = "rate_limited"
-            async with db.execute(
+            async with reader() as db, db.execute(
                 "SELECT best_score FROM players WHERE id = ?", (user_id,)
             ) as cur:
                 row = await cur.fetchone()
@@ -172,33 +535,17 @@ async def post_score(payload: ScoreIn, request: Request):
                 "best_score": best,
             }
             headers = {"Retry-After": str(RATE_LIMIT_SECONDS)}
-            return JSONResponse(
+            return ORJSONResponse(
                 status_code=200,
                 content={"ok": True, "rate_limited": True, "me": me},
                 headers=headers,
             )
-        LAST_SCORES[user_id] = now_dt
-
-        async with db.execute(
-            "SELECT best_score FROM players WHERE id = ?", (user_id,)
-        ) as cur:
-            row = await cur.fetchone()
-        prev_best = row[0] if row else 0
-
-        best = prev_best
-        if row is None or payload.score > prev_best:
-            now = now_dt.isoformat()
-            query = (
-                "INSERT INTO players (id, username, display_name, best_score, updated_at) "
-                "VALUES (?, ?, ?, ?, ?) "
-                "ON CONFLICT(id) DO UPDATE SET "
-                "username=excluded.username, display_name=excluded.display_name, "
-                "best_score=excluded.best_score, updated_at=excluded.updated_at"
-            )
-            params = (user_id, username, display_name, payload.score, now)
-            await db.execute(query, params)
-            await db.commit()
-            best = payload.score
+        LAST_SCORES[user_id] = now
+        LAST_SCORES.move_to_end(user_id)
+        if len(LAST_SCORES) > RATE_LIMIT_CAPACITY:
+            LAST_SCORES.popitem(last=False)
+
+        best = await queue_score(user_id, username, display_name, score)
 
         me = {
             "id": user_id,
@@ -211,7 +558,7 @@ async def post_score(payload: ScoreIn, request: Request):
         status = 500
         reason = "server_error"
         logger.exception("score handler error")
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=500, content={"ok": False, "error": "server_error"}
         )
     finally:
@@ -228,69 +575,97 @@ async def post_score(payload: ScoreIn, request: Request):
 if DEBUG:
     @app.get("/auth_check")
     async def auth_check(initData: str, echo: str | None = None):
-        tokens = get_tokens()
-        ok, user, reason, data_check_string = check_telegram_auth(initData, tokens)
+        ok, user, reason, data_check_string = check_telegram_auth(initData, TOKEN_HMACS)
         if echo == "1":
             return {
                 "data_check_string": data_check_string,
                 "note": "for debugging only",
             }
         if not ok:
-            return JSONResponse(status_code=401, content={"ok": False, "error": reason})
+            return ORJSONResponse(status_code=401, content={"ok": False, "error": reason})
         user_id = str(user.get("id"))
-        username = user.get("username")
-        first_name = user.get("first_name")
-        last_name = user.get("last_name")
-        display_name = username or first_name or last_name or f"Player {user_id[-4:]}"
+        display_name = make_display_name(user, user_id)
         resp = {"ok": True, "user": user, "display_name": display_name}
         return resp
 
 
+# Constant bodies are serialized once at import.
+HEALTH_BODY = orjson.dumps({"ok": True})
+ROOT_BODY = orjson.dumps({"ok": True, "service": "bugman-bot"})
+
+
 @app.get("/health")
-async def health() -> dict:
-    return {"ok": True}
+async def health() -> Response:
+    return Response(content=HEALTH_BODY, media_type="application/json")
 
 
 @app.get("/")
-async def root() -> dict:
-    return {"ok": True, "service": "bugman-bot"}
+async def root() -> Response:
+    return Response(content=ROOT_BODY, media_type="application/json")
 
 
 @app.get("/leaderboard")
 async def get_leaderboard(limit: int = 100, offset: int = 0):
-    if limit > 200:
-        limit = 200
-
-    db = app.state.db
-    async with db.execute(
-        "SELECT display_name, username, best_score FROM players ORDER BY best_score DESC "
-        "LIMIT ? OFFSET ?",
+    # SQLite reads a negative LIMIT as "no limit": clamp before the page is
+    # queried and cached.
+    limit = max(1, min(limit, 200))
+    offset = max(0, offset)
+
+    # Short-lived cache keyed by page and by lb_version, which the score writer
+    # bumps on every new best: a query that was already running when scores
+    # changed stores its result under the old version, where nobody reads it.
+    key = (app.state.lb_version, limit, offset)
+    cached = app.state.lb_cache.get(key)
+    now = time.monotonic()
+    if cached and now - cached[0] < LEADERBOARD_TTL:
+        return Response(content=cached[1], media_type="application/json")
+
+    # Rows are turned into dicts in Python rather than with json_group_array:
+    # SQLite does not guarantee the order an aggregate sees its input in, and
+    # this only runs on a cache miss.
+    async with reader() as db, db.execute(
+        "SELECT display_name, username, best_score, updated_at_ms FROM players "
+        "ORDER BY best_score DESC LIMIT ? OFFSET ?",
         (limit, offset),
     ) as cur:
         rows = await cur.fetchall()
 
     items = [
-        {"display_name": d, "username": u, "best_score": s} for d, u, s in rows
+        {"display_name": d, "username": u, "best_score": s, "updated_at_ms": t}
+        for d, u, s, t in rows
     ]
-    return {"items": items}
+    body = orjson.dumps({"items": items})
+    # Pages that expired or belong to an older lb_version are dropped here
+    # rather than waiting for the next full clear.
+    app.state.lb_cache = {
+        k: v
+        for k, v in app.state.lb_cache.items()
+        if k[0] == app.state.lb_version and now - v[0] < LEADERBOARD_TTL
+    }
+    if len(app.state.lb_cache) >= LEADERBOARD_CACHE_SIZE:
+        app.state.lb_cache.clear()
+    app.state.lb_cache[key] = (now, body)
+    return Response(content=body, media_type="application/json")
 
 
 @app.get("/scoreboard")
 async def get_scoreboard():
-    db = app.state.db
-    async with db.execute(
-        "SELECT display_name, username, best_score FROM players ORDER BY best_score DESC LIMIT 100"
-    ) as cur:
-        rows = await cur.fetchall()
-
-    items = [
-        {"display_name": d, "username": u, "best_score": s} for d, u, s in rows
-    ]
-    return {"items": items}
+    return await get_leaderboard(limit=100, offset=0)
 
 
 if __name__ == "__main__":
     import uvicorn
 
-    uvicorn.run("server:app", host="0.0.0.0", port=PORT)
+    # access_log=False: post_score already logs one line per request itself.
+    # One worker on purpose: rate limits, caches and the single SQLite writer
+    # live in this process.
+    uvicorn.run(
+        "server:app",
+        host="0.0.0.0",
+        port=PORT,
+        # "auto" picks uvloop when it is installed (it is not on Windows).
+        loop="auto",
+        http="httptools",
+        access_log=False,
+    )
 